@@ -1,13 +1,24 @@
 from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
+import asyncio
 import base64
 import os
 import requests
 from modules.eagle_api import eagle_api
+from modules.event_stream import event_broker, EagleWatcher
+from modules.placeholder import PlaceholderStore
+from modules.decode_budget import decode_budget, DecodeBusyError
+
+# 混雑・Eagleの不調で処理を断ったときに再試行を促すまでの秒数
+RETRY_AFTER_SECONDS = 5
+
+def service_unavailable(e: Exception) -> HTTPException:
+    """混雑・Eagleの不調で処理できないことを 503 で返す"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
 
 class ImageRequest(BaseModel):
     path: str
@@ -22,32 +33,58 @@ class UpdateRequest(BaseModel):
 class MoveToTrashRequest(BaseModel):
     itemIds: list[str]
 
+class EventStreamSkippingGZipMiddleware(GZipMiddleware):
+    """
+    SSEは圧縮するとバッファリングされて届かなくなるので除外する
+    """
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/events"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 app = FastAPI()
 # GZip圧縮を有効化
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(EventStreamSkippingGZipMiddleware, minimum_size=1000)
+
+# Eagle側の変更を監視してイベント配信
+eagle_watcher = EagleWatcher(eagle_api, event_broker)
+
+@app.on_event("startup")
+async def start_eagle_watcher():
+    eagle_watcher.start()
+
+@app.on_event("shutdown")
+async def stop_eagle_watcher():
+    await eagle_watcher.stop()
+
+# 一覧表示用プレースホルダー
+placeholder_store = PlaceholderStore(eagle_api.get_thumbnail_path)
 
 # APIルーター
 from fastapi import APIRouter
 api_router = APIRouter()
 
 @api_router.get("/list")
-async def get_list(
+def get_list(
     limit: int = 200,
     offset: int = 0,
     orderBy: str = None,
     keyword: str = None,
     ext: str = None,
     tags: str = None,
-    folders: str = None
+    folders: str = None,
+    placeholder: bool = False
 ):
     """
     Eagle APIから最新の画像一覧を取得
     Args:
         limit (int): 取得する画像の最大数（デフォルト: 100）
         folder_id (str, optional): 指定されたフォルダーIDの画像のみを取得
+        placeholder (bool): 各アイテムに極小プレースホルダー画像（data URI）を付与する
     """
     try:
-        return eagle_api.get_list(
+        data = eagle_api.get_list(
             limit=limit,
             offset=offset,
             orderBy=orderBy,
@@ -56,21 +93,30 @@ async def get_list(
             tags=tags,
             folders=folders
         )
+        if placeholder and isinstance(data.get('data'), list):
+            # キャッシュされた一覧を書き換えないようにコピーしてから付与
+            data = {**data, 'data': [dict(item) for item in data['data']]}
+            placeholder_store.attach(data['data'])
+        return data
+    except requests.exceptions.RequestException as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/folders")
-async def get_folders():
+def get_folders():
     """
     Eagle APIからフォルダ一覧を取得
     """
     try:
         return eagle_api.get_folder_list()
+    except requests.exceptions.RequestException as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/get_thumbnail_image")
-async def get_thumbnail_image(id):
+def get_thumbnail_image(id):
     """
     アイテムIDからサムネイル画像を取得
     """
@@ -81,11 +127,15 @@ async def get_thumbnail_image(id):
         
         content, content_type = result
         return Response(content=content, media_type=content_type)
+    except HTTPException:
+        raise
+    except requests.exceptions.RequestException as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/get_image")
-async def get_image(id: str, ext: str = "png", max_file_size: int = 1480, quality: int = 85):
+def get_image(id: str, ext: str = "png", max_file_size: int = 1480, quality: int = 85):
     """
     アイテムIDからオリジナル画像を取得
     - max_file_size: 最大容量をKB単位で指定。これ以上ならjpeg圧縮をかける。0なら圧縮しない
@@ -102,9 +152,71 @@ async def get_image(id: str, ext: str = "png", max_file_size: int = 1480, qualit
         
         content, content_type = result
         return Response(content=content, media_type=content_type)
+    except HTTPException:
+        raise
+    except (requests.exceptions.RequestException, DecodeBusyError) as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/tile_info")
+def get_tile_info(id: str, ext: str = "png"):
+    """
+    オリジナル画像のタイルピラミッド情報を取得（DZI形式相当）
+    - width, height: 原寸
+    - tileSize: タイルの一辺
+    - maxLevel: 原寸に相当するレベル（0が1x1px）
+    """
+    try:
+        result = eagle_api.get_tile_info(id, ext)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return result
+    except HTTPException:
+        raise
+    except requests.exceptions.RequestException as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/tile/{id}/{level}/{x}_{y}")
+def get_tile(id: str, level: int, x: int, y: int, ext: str = "png"):
+    """
+    オリジナル画像から指定レベル・位置のタイルを取得
+    - 拡大表示時に必要な範囲だけを原寸で取得するため
+    """
+    try:
+        result = eagle_api.get_tile(id, level, x, y, ext)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        content, content_type = result
+        return Response(content=content, media_type=content_type)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (requests.exceptions.RequestException, DecodeBusyError) as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/decode_status")
+async def get_decode_status():
+    """
+    画像デコードのメモリ予算の使用状況を取得
+    - waiting: 予算待ちのデコード数（キューの深さ）
+    """
+    return decode_budget.get_status()
+
+@api_router.get("/upstream_status")
+async def get_upstream_status():
+    """
+    Eagle API呼び出しのサーキットブレーカーの状態を取得
+    - open: Eagleが不調なため呼び出しを止めている
+    - failures: 連続で失敗した回数
+    """
+    return eagle_api.breaker.get_status()
 
 @api_router.post("/update")
 async def update_item(request: UpdateRequest):
@@ -113,10 +225,15 @@ async def update_item(request: UpdateRequest):
     """
     try:
         data = request.dict(exclude_none=True)
-        result = eagle_api.update_item(data["id"], data)
+        changes = dict(data)
+        # Eagleの応答待ちでイベントループを止めないようにスレッドで実行
+        result = await asyncio.to_thread(eagle_api.update_item, data["id"], data)
         if result["status"] == "error":
             raise HTTPException(status_code=500, detail=result["message"])
+        event_broker.publish("item.updated", changes)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -126,13 +243,31 @@ async def move_to_trash(request: MoveToTrashRequest):
     指定したアイテムをゴミ箱に移動する
     """
     try:
-        result = eagle_api.move_to_trash(request.itemIds)
+        result = await asyncio.to_thread(eagle_api.move_to_trash, request.itemIds)
         if result["status"] == "error":
             raise HTTPException(status_code=500, detail=result["message"])
+        event_broker.publish("item.deleted", {"ids": request.itemIds})
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/events")
+async def get_events():
+    """
+    アイテム・フォルダの変更をServer-Sent Eventsで配信する
+    - item.updated: {id, 変更されたプロパティ}
+    - item.added: {item}
+    - item.deleted: {ids}
+    - folder.changed: {ids}
+    """
+    return StreamingResponse(
+        event_broker.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # CORSの設定
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from .debug_logger import debug_print
+
+
+# 同時にデコードしてよいメモリ量の上限（MB）
+DECODE_BUDGET_MB = 1024
+# 予算が空くまで待つ時間（秒）。超えたら解像度を落としてデコードする
+DEGRADE_WAIT_SECONDS = 2
+# 予算が空くまで待つ最大時間（秒）。超えたら DecodeBusyError
+MAX_WAIT_SECONDS = 30
+# 予算待ちの最大数。超えたら待たずに DecodeBusyError
+MAX_WAITING = 16
+# 変換・リサイズの作業用コピーを見込んだ係数
+WORKING_COPY_FACTOR = 2
+
+# モードごとの1pxあたりのバイト数（Pillowのメモリ上の表現）
+# RGB・LAなども内部では4byte/pxで保持される
+BYTES_PER_PIXEL = {
+    '1': 1, 'L': 1, 'P': 1,
+    'I;16': 2, 'I;16B': 2, 'I;16L': 2,
+    'LA': 4, 'PA': 4, 'La': 4,
+    'RGB': 4, 'YCbCr': 4, 'LAB': 4, 'HSV': 4,
+    'RGBA': 4, 'RGBa': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4,
+}
+
+
+class DecodeBusyError(Exception):
+    """デコード待ちが多すぎる・長すぎるため処理を断る"""
+
+
+def get_draft_size(image, size: tuple[int, int] | None) -> tuple[int, int]:
+    """
+    draft() で縮小デコードした場合のサイズを求める（Pillowと同じ計算）
+    - JPEG以外は縮小デコードできないので原寸
+    """
+    width, height = image.size
+    if size is None or image.format != 'JPEG':
+        return width, height
+    scale = min(width // max(size[0], 1), height // max(size[1], 1))
+    for sc in (8, 4, 2, 1):
+        if scale >= sc:
+            scale = sc
+            break
+    else:
+        scale = 1
+    return (width + scale - 1) // scale, (height + scale - 1) // scale
+
+
+def estimate_decode_cost(image, size: tuple[int, int] | None = None, mode: str | None = None) -> int:
+    """
+    画像ヘッダーからデコードに必要なメモリ量（byte）を見積もる
+    - Image.open() 直後（未デコード）の画像を渡す
+    - size: draft() で縮小デコードする場合の要求サイズ
+    - mode: デコード後に変換して作業するモード（パレット画像をRGBAにする場合など）
+    """
+    width, height = get_draft_size(image, size)
+    bytes_per_pixel = max(BYTES_PER_PIXEL.get(image.mode, 4), BYTES_PER_PIXEL.get(mode or image.mode, 4))
+    return width * height * bytes_per_pixel * WORKING_COPY_FACTOR
+
+
+class DecodeBudget:
+    """
+    画像デコードのメモリ使用量を予算内に収めるためのアドミッション制御
+    - 予算に空きがあるジョブだけを実行し、残りは到着順に待たせる
+    - 単体で予算を超えるジョブは他のジョブが終わるまで待ってから単独で実行する
+    - 先頭のジョブが待っている間は後続を追い越させない（大きいジョブが飢えないように）
+    """
+    def __init__(self, budget_bytes: int = DECODE_BUDGET_MB * 1024 * 1024, max_waiting: int = MAX_WAITING):
+        self.budget = budget_bytes
+        self.max_waiting = max_waiting
+        self.in_use = 0
+        self.active = 0
+        self.queue: deque = deque()
+        self.condition = threading.Condition()
+
+    def can_admit(self, cost: int) -> bool:
+        # 単体で予算を超えるものは実行中のジョブが無いときだけ通す
+        return self.in_use + cost <= self.budget or self.active == 0
+
+    def try_acquire(self, cost: int, timeout: float | None = None) -> bool:
+        """
+        予算を確保する
+        - timeout: 待つ時間（秒）。None なら空くまで待つ
+        - 戻り値: 確保できたら True。待ちが max_waiting 件を超える場合は待たずに False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            if not self.queue and self.can_admit(cost):
+                self.in_use += cost
+                self.active += 1
+                return True
+            if len(self.queue) >= self.max_waiting:
+                return False
+
+            ticket = object()
+            self.queue.append(ticket)
+            try:
+                while self.queue[0] is not ticket or not self.can_admit(cost):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                self.in_use += cost
+                self.active += 1
+                return True
+            finally:
+                self.queue.remove(ticket)
+                # 次の順番のジョブを起こす
+                self.condition.notify_all()
+
+    def release(self, cost: int):
+        with self.condition:
+            self.in_use -= cost
+            self.active -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def admit(self, image, target_size: tuple[int, int] | None = None, degraded_size: tuple[int, int] | None = None, mode: str | None = None):
+        """
+        デコード前に予算を確保するコンテキストマネージャー
+        - image: Image.open() 直後（未デコード）の画像
+        - target_size: 必要な解像度。JPEGはこのサイズまで縮小デコードする
+        - degraded_size: 予算が空かないときに落とす解像度（縮小デコードできるJPEGのみ。それ以外は待つ）
+        - mode: デコード後に変換して作業するモード
+        - 戻り値: 解像度を落としてデコードする場合は True
+        - 混雑で予算を確保できない場合は DecodeBusyError
+        """
+        # draft() は1回しか効かないので、解像度を決めてから呼ぶ
+        size = target_size
+        degraded = False
+        cost = estimate_decode_cost(image, size, mode)
+
+        # 縮小デコードで実際に小さくなる場合だけ、待ちきれなかったときに解像度を落とす
+        can_degrade = False
+        if degraded_size is not None:
+            target_width, target_height = get_draft_size(image, target_size)
+            degraded_width, degraded_height = get_draft_size(image, degraded_size)
+            can_degrade = degraded_width * degraded_height < target_width * target_height
+
+        admitted = self.try_acquire(cost, DEGRADE_WAIT_SECONDS if can_degrade else MAX_WAIT_SECONDS)
+        if not admitted and can_degrade:
+            # 混雑時は解像度を落としてデコード量を減らす
+            size = degraded_size
+            degraded = True
+            cost = estimate_decode_cost(image, size, mode)
+            debug_print(f"Decode budget busy, degrading to {get_draft_size(image, size)}")
+            admitted = self.try_acquire(cost, MAX_WAIT_SECONDS)
+        if not admitted:
+            raise DecodeBusyError(f"Decode budget busy ({len(self.queue)} waiting)")
+
+        if size is not None:
+            image.draft('RGB' if image.mode not in ('L', 'RGB') else image.mode, size)
+
+        try:
+            yield degraded
+        finally:
+            self.release(cost)
+
+    def get_status(self) -> dict:
+        """現在の予算使用状況"""
+        with self.condition:
+            return {
+                "budget": self.budget,
+                "inUse": self.in_use,
+                "active": self.active,
+                "waiting": len(self.queue),
+            }
+
+
+decode_budget = DecodeBudget()
@@ -3,6 +3,8 @@ import json
 import os
 from urllib.parse import unquote
 from .util import load_image
+from .tile import get_tile_info, load_tile
+from .upstream import CircuitBreaker, StaleCache, REQUEST_TIMEOUT, is_upstream_failure
 from .debug_logger import debug_print
 
 
@@ -15,123 +17,215 @@ QUALITY = 85
 class EagleApi:
     def __init__(self):
         self.base_url = 'http://localhost:41595'
+        # Eagleが不調なときは呼び出さずに即座に失敗させる
+        self.breaker = CircuitBreaker()
+        # 前回の結果を即座に返し、裏で取り直す（stale-while-revalidate）
+        self.list_cache = StaleCache(fresh_seconds=5, stale_seconds=300, max_entries=200)
+        self.folder_cache = StaleCache(fresh_seconds=10, stale_seconds=600, max_entries=1)
+        self.thumbnail_path_cache = StaleCache(fresh_seconds=600, stale_seconds=86400, max_entries=50000)
+
+    def request(self, method: str, path: str, **kwargs):
+        """
+        Eagle APIを呼び出す（タイムアウト・サーキットブレーカー付き）
+        - 失敗時は requests.exceptions.RequestException を投げる
+        """
+        self.breaker.before_call()
+        try:
+            response = requests.request(method, f'{self.base_url}{path}', timeout=REQUEST_TIMEOUT, **kwargs)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            if is_upstream_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return response
 
     def get_list(self, limit=200, offset=0, orderBy=None, keyword=None, ext=None, tags=None, folders=None):
         """
-        画像一覧を取得
+        画像一覧を取得（キャッシュ付き）
         Args:
             limit (int): 取得する画像の最大数
             folder_id (str, optional): 指定されたフォルダーIDの画像のみを取得
         """
         try:
-            # URLパラメータを構築
-            params = f'limit={limit}&offset={offset}'
-            if orderBy:
-                params += f'&orderBy={orderBy}'
-            if keyword:
-                params += f'&keyword={keyword}'
-            if ext:
-                params += f'&ext={ext}'
-            if tags:
-                params += f'&tags={tags}'
-            if folders:
-                params += f'&folders={folders}'
-            
-            url = f'{self.base_url}/api/item/list?{params}'
-            debug_print(f"Requesting images from Eagle API with params: {params}")
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            debug_print(f"Eagle API response received. Status: {response.status_code}")
-
-            if 'data' in data and isinstance(data['data'], list):
-                if DEBUG:
-                    debug_print(f"DEBUG MODE: Limiting results to {DEBUG_LIMIT} items")
-                    data['data'] = data['data'][:DEBUG_LIMIT]
-                debug_print(f"Processing {len(data['data'])} items")
-                
-                # starプロパティをintに変換
-                for item in data['data']:
-                    if 'star' in item:
-                        try:
-                            item['star'] = int(item['star']) if item['star'] is not None else 0
-                        except (ValueError, TypeError):
-                            item['star'] = 0
-            else:
-                debug_print("Unexpected data structure:", data)
-
-            return data
+            key = (limit, offset, orderBy, keyword, ext, tags, folders)
+            return self.list_cache.get(key, lambda: self.fetch_list(limit, offset, orderBy, keyword, ext, tags, folders))
         except requests.exceptions.RequestException as e:
+            if is_upstream_failure(e):
+                # Eagleの不調は呼び出し元で 503 にする
+                raise
             error_msg = f"Eagle API error: {str(e)}"
             debug_print(error_msg)
-            if hasattr(response, 'text'):
-                debug_print(f"Response content: {response.text}")
+            if getattr(e, 'response', None) is not None:
+                debug_print(f"Response content: {e.response.text}")
             return {"status": "error", "message": error_msg}
 
+    def fetch_list(self, limit=200, offset=0, orderBy=None, keyword=None, ext=None, tags=None, folders=None):
+        """
+        Eagle APIから画像一覧を取得
+        - 失敗時は requests.exceptions.RequestException を投げる
+        """
+        # URLパラメータを構築
+        params = f'limit={limit}&offset={offset}'
+        if orderBy:
+            params += f'&orderBy={orderBy}'
+        if keyword:
+            params += f'&keyword={keyword}'
+        if ext:
+            params += f'&ext={ext}'
+        if tags:
+            params += f'&tags={tags}'
+        if folders:
+            params += f'&folders={folders}'
+
+        debug_print(f"Requesting images from Eagle API with params: {params}")
+        response = self.request('get', f'/api/item/list?{params}')
+        data = response.json()
+        debug_print(f"Eagle API response received. Status: {response.status_code}")
+
+        if 'data' in data and isinstance(data['data'], list):
+            if DEBUG:
+                debug_print(f"DEBUG MODE: Limiting results to {DEBUG_LIMIT} items")
+                data['data'] = data['data'][:DEBUG_LIMIT]
+            debug_print(f"Processing {len(data['data'])} items")
+
+            # starプロパティをintに変換
+            for item in data['data']:
+                if 'star' in item:
+                    try:
+                        item['star'] = int(item['star']) if item['star'] is not None else 0
+                    except (ValueError, TypeError):
+                        item['star'] = 0
+        else:
+            debug_print("Unexpected data structure:", data)
+
+        return data
+
     def get_folder_list(self):
-        """フォルダ一覧を取得"""
+        """フォルダ一覧を取得（キャッシュ付き）"""
         try:
-            response = requests.get(f'{self.base_url}/api/folder/list')
-            response.raise_for_status()
-            return response.json()
+            return self.folder_cache.get('folders', self.fetch_folder_list)
         except requests.exceptions.RequestException as e:
+            if is_upstream_failure(e):
+                raise
             debug_print(f"Eagle API error: {e}")
             return {"status": "error", "message": str(e)}
 
+    def fetch_folder_list(self):
+        """
+        Eagle APIからフォルダ一覧を取得
+        - 失敗時は requests.exceptions.RequestException を投げる
+        """
+        return self.request('get', '/api/folder/list').json()
+
+    def get_thumbnail_path(self, image_id):
+        """
+        指定したIDのサムネイル画像のローカルパスを取得（キャッシュ付き）
+        - 取得できなかった場合は None
+        """
+        return self.thumbnail_path_cache.get(image_id, lambda: self.fetch_thumbnail_path(image_id))
+
+    def fetch_thumbnail_path(self, image_id):
+        """
+        Eagle APIからサムネイル画像のローカルパスを取得
+        - 失敗時は requests.exceptions.RequestException を投げる
+        """
+        data = self.request('get', f"/api/item/thumbnail?id={image_id}").json()
+
+        if data['status'] == 'success' and 'data' in data:
+            # URLエンコードされたパスをデコード
+            return unquote(data['data'])
+
+        debug_print(f"Unexpected response: {data}")
+        return None
+
     def get_thumbnail_image(self, image_id):
         """
         指定したIDのサムネイル画像を取得して Base64で返す
         """
         try:
-            response = requests.get(f"{self.base_url}/api/item/thumbnail?id={image_id}")
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['status'] == 'success' and 'data' in data:
-                # URLエンコードされたパスをデコード
-                decoded_path = unquote(data['data'])
-                # ローカルファイルパスから画像を読み込む
-                return load_image(decoded_path)
-            else:
-                debug_print(f"Unexpected response: {data}")
+            path = self.get_thumbnail_path(image_id)
+            if path is None:
                 return None
-                
+            # ローカルファイルパスから画像を読み込む
+            return load_image(path)
+
         except (requests.exceptions.RequestException, IOError) as e:
+            if is_upstream_failure(e):
+                raise
             debug_print(f"Error getting thumbnail image: {e}")
             return None
 
-    def get_image(self, image_id, ext="png", max_file_size=MAX_FILE_SIZE, quality=QUALITY):
+    def get_original_path(self, image_id, ext="png"):
         """
-        - 指定したIDのオリジナル画像を返す
+        - 指定したIDのオリジナル画像のローカルパスを取得
         - サムネイルはオリジナルと同じフォルダにあり、`{ファイル名}_thumbnail.png` という名前なので、そこからオリジナルを取得する
         - サムネイルファイル名に `_thumbnail.png` が無ければオリジナルがサムネイルとして使われている
         - 拡張子は引数 ext を使う
         """
+        path = self.get_thumbnail_path(image_id)
+        if path is None:
+            return None
+
+        if path.endswith('_thumbnail.png'):
+            # サムネイルの場合、オリジナルのパスを生成
+            # '_thumbnail.png' を削除してオリジナルの拡張子に変更
+            base_path = path[:-14]  # '_thumbnail.png' の長さ(14)を削除
+            return f"{base_path}.{ext}"
+        # サムネイルが作られていない場合は、パスをそのまま使用
+        return path
+
+    def get_image(self, image_id, ext="png", max_file_size=MAX_FILE_SIZE, quality=QUALITY):
+        """
+        指定したIDのオリジナル画像を返す
+        """
         try:
-            response = requests.get(f"{self.base_url}/api/item/thumbnail?id={image_id}")
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['status'] == 'success' and 'data' in data:
-                path = unquote(data['data'])
-                if path.endswith('_thumbnail.png'):
-                    # サムネイルの場合、オリジナルのパスを生成
-                    # '_thumbnail.png' を削除してオリジナルの拡張子に変更
-                    base_path = path[:-14]  # '_thumbnail.png' の長さ(14)を削除
-                    original_path = f"{base_path}.{ext}"
-                else:
-                    # サムネイルが作られていない場合は、パスをそのまま使用
-                    original_path = path
-                # ローカルファイルパスから画像を読み込む
-                return load_image(original_path, max_file_size, quality)
-            else:
-                debug_print(f"Unexpected response: {data}")
+            original_path = self.get_original_path(image_id, ext)
+            if original_path is None:
                 return None
-                
+            # ローカルファイルパスから画像を読み込む
+            return load_image(original_path, max_file_size, quality)
+
         except (requests.exceptions.RequestException, IOError) as e:
+            if is_upstream_failure(e):
+                raise
             debug_print(f"Error getting image: {e}")
             return None
 
+    def get_tile_info(self, image_id, ext="png"):
+        """
+        指定したIDのオリジナル画像のタイルピラミッド情報を返す
+        """
+        try:
+            original_path = self.get_original_path(image_id, ext)
+            if original_path is None:
+                return None
+            return get_tile_info(original_path)
+
+        except (requests.exceptions.RequestException, IOError) as e:
+            if is_upstream_failure(e):
+                raise
+            debug_print(f"Error getting tile info: {e}")
+            return None
+
+    def get_tile(self, image_id, level, x, y, ext="png"):
+        """
+        指定したIDのオリジナル画像からタイルを切り出して返す
+        """
+        try:
+            original_path = self.get_original_path(image_id, ext)
+            if original_path is None:
+                return None
+            return load_tile(original_path, level, x, y)
+
+        except (requests.exceptions.RequestException, IOError) as e:
+            if is_upstream_failure(e):
+                raise
+            debug_print(f"Error getting tile: {e}")
+            return None
+
 
     def get_image_info(self, image_id):
         """
@@ -139,9 +233,7 @@ class EagleApi:
         しかし /item/list で取得できるものとほぼ同じ（？）なので今回は使わないのでは？
         """
         try:
-            response = requests.get(f'{self.base_url}/api/item/info?id={image_id}')
-            response.raise_for_status()
-            return response.json()
+            return self.request('get', f'/api/item/info?id={image_id}').json()
         except requests.exceptions.RequestException as e:
             debug_print(f"Error getting image detail: {e}")
             return None
@@ -154,15 +246,15 @@ class EagleApi:
             data (dict): 更新するデータ（tags, annotation, url, starなど）
         """
         try:
-            url = f'{self.base_url}/api/item/update'
             data['id'] = item_id
 
             if 'star' in data and isinstance(data['star'], (int, float)):
                 data['star'] = str(data['star'])
 
-            response = requests.post(url, json=data)
-            response.raise_for_status()
-            return response.json()
+            result = self.request('post', '/api/item/update', json=data).json()
+            # 次回の一覧取得では変更後の内容を取り直す
+            self.list_cache.invalidate()
+            return result
         except requests.exceptions.RequestException as e:
             debug_print(f"Error updating item: {e}")
             return {"status": "error", "message": str(e)}
@@ -174,14 +266,14 @@ class EagleApi:
             item_ids (list): 削除する画像のIDリスト
         """
         try:
-            url = f'{self.base_url}/api/item/moveToTrash'
             data = {"itemIds": item_ids}
             
             debug_print(f"Moving items to trash: {item_ids}")
-            response = requests.post(url, json=data)
-            response.raise_for_status()
-            result = response.json()
+            result = self.request('post', '/api/item/moveToTrash', json=data).json()
             debug_print(f"Move to trash result: {result}")
+            # 次回の一覧取得では変更後の内容を取り直す
+            self.list_cache.invalidate()
+            self.folder_cache.invalidate()
             return result
         except requests.exceptions.RequestException as e:
             debug_print(f"Error moving items to trash: {e}")
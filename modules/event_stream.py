@@ -0,0 +1,202 @@
+import asyncio
+import json
+from .debug_logger import debug_print
+
+
+# 監視間隔（秒）
+POLL_INTERVAL = 10
+# 差分監視の対象にする最新アイテム数
+POLL_ITEM_LIMIT = 200
+# 差分監視の並び順（追加日の新しい順。新規アイテムは必ず先頭に来る）
+POLL_ORDER_BY = '-CREATEDATE'
+# 接続維持用のコメント送信間隔（秒）
+HEARTBEAT_INTERVAL = 15
+# 購読者ごとのキュー上限（溢れたら古いクライアントとみなして切断）
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# 差分検出に使うアイテムのプロパティ
+ITEM_WATCH_KEYS = ('name', 'star', 'tags', 'annotation', 'folders', 'modificationTime', 'lastModified')
+
+
+class EventBroker:
+    """
+    アイテム・フォルダの変更イベントを購読者（SSE接続）に配信する
+    """
+    def __init__(self):
+        self.subscribers: set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        debug_print(f"Event subscriber added. Total: {len(self.subscribers)}")
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        debug_print(f"Event subscriber removed. Total: {len(self.subscribers)}")
+
+    def publish(self, event: str, data: dict):
+        """
+        全購読者にイベントを送信（イベントループ上から呼ぶこと）
+        Args:
+            event (str): イベント種別（item.updated, item.added, item.deleted, folder.changed）
+            data (dict): イベント内容
+        """
+        message = format_sse(event, data)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 受信が追いつかないクライアントは切断して再接続させる
+                debug_print("Event subscriber queue full, dropping subscriber")
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream(self):
+        """
+        SSE形式のメッセージを返す非同期ジェネレーター
+        """
+        queue = self.subscribe()
+        try:
+            yield f"retry: {HEARTBEAT_INTERVAL * 1000}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(queue)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """SSEのメッセージ形式に変換"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def diff_item_window(prev: list[dict], current: list[dict]):
+    """
+    追加日の新しい順に並んだ先頭N件の前回・今回を比較する
+    - 監視範囲は先頭N件だけなので、範囲の端で出入りしたものは変更とみなさない
+    - added: 今回の先頭から、前回も存在したアイテムが現れるまでの新しいアイテム
+    - updated: 両方に存在し、プロパティが変わったアイテム（{id, 変更されたプロパティ}）
+    - deleted: 今回も残っているアイテムより新しいのに消えたアイテムのID
+    - 戻り値: (added, updated, deleted)
+    """
+    prev_by_id = {item['id']: item for item in prev}
+    current_ids = {item['id'] for item in current}
+
+    # 新規アイテムは先頭にしか現れない。前回との共通アイテムが無ければ確認できないので何もしない
+    added = []
+    for item in current:
+        if item['id'] in prev_by_id:
+            break
+        added.append(item)
+    else:
+        added = []
+
+    updated = []
+    for item in current:
+        before = prev_by_id.get(item['id'])
+        if before is None:
+            continue
+        changes = {key: item.get(key) for key in ITEM_WATCH_KEYS if item.get(key) != before.get(key)}
+        if changes:
+            updated.append({"id": item['id'], **changes})
+
+    # 今回も残っている最も古いアイテムより新しいものは、まだ範囲内のはずなので消えたら削除と確定できる
+    last_kept = 0
+    for index, item in enumerate(prev):
+        if item['id'] in current_ids:
+            last_kept = index
+    deleted = [item['id'] for item in prev[:last_kept] if item['id'] not in current_ids]
+
+    return added, updated, deleted
+
+
+class EagleWatcher:
+    """
+    Eagle APIを定期的に取得して前回との差分をイベントとして配信する
+    - Eagle本体で行われた変更や、他のクライアントからの変更を検出するため
+    - キャッシュを通さずに取得する
+    """
+    def __init__(self, eagle_api, broker: EventBroker):
+        self.eagle_api = eagle_api
+        self.broker = broker
+        self.items: list[dict] | None = None
+        self.folders: dict[str, tuple] | None = None
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            # 購読者がいない間はEagleに負荷をかけない
+            if not self.broker.subscribers:
+                self.items = None
+                self.folders = None
+                continue
+            try:
+                await self.check_items()
+                await self.check_folders()
+            except Exception as e:
+                debug_print(f"Error while watching Eagle: {e}")
+
+    async def check_items(self):
+        data = await asyncio.to_thread(self.eagle_api.fetch_list, limit=POLL_ITEM_LIMIT, orderBy=POLL_ORDER_BY)
+        if not isinstance(data.get('data'), list):
+            return
+
+        items = data['data']
+        if self.items is not None:
+            added, updated, deleted = diff_item_window(self.items, items)
+            if added or updated or deleted:
+                # イベントを受けたクライアントが取り直したときにキャッシュの古い一覧を返さないように
+                self.eagle_api.list_cache.invalidate()
+            for item in added:
+                self.broker.publish('item.added', {"item": item})
+            for changes in updated:
+                self.broker.publish('item.updated', changes)
+            if deleted:
+                self.broker.publish('item.deleted', {"ids": deleted})
+        self.items = items
+
+    async def check_folders(self):
+        data = await asyncio.to_thread(self.eagle_api.fetch_folder_list)
+        if not isinstance(data.get('data'), list):
+            return
+
+        folders = {}
+        def walk(folder_list):
+            for folder in folder_list:
+                folders[folder['id']] = (folder.get('name'), folder.get('modificationTime'), folder.get('imageCount'))
+                walk(folder.get('children') or [])
+        walk(data['data'])
+
+        if self.folders is not None and folders != self.folders:
+            changed = [folder_id for folder_id in folders.keys() | self.folders.keys()
+                       if folders.get(folder_id) != self.folders.get(folder_id)]
+            self.eagle_api.folder_cache.invalidate()
+            self.broker.publish('folder.changed', {"ids": changed})
+        self.folders = folders
+
+
+event_broker = EventBroker()
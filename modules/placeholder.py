@@ -0,0 +1,138 @@
+import base64
+import io
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from .util import CACHE_DIR
+from .decode_budget import decode_budget
+from .debug_logger import debug_print
+
+
+# プレースホルダーの保存先
+PLACEHOLDER_DB = os.path.join(CACHE_DIR, "placeholder.db")
+# プレースホルダー画像の長辺（px）
+PLACEHOLDER_SIZE = 16
+# プレースホルダー画像のjpeg圧縮率
+# ハフマンテーブルを最適化して~320byte（base64で~430byte）程度になる
+PLACEHOLDER_QUALITY = 40
+
+
+def make_placeholder(path: str) -> bytes:
+    """
+    サムネイル画像から極小のJPEGを生成
+    - path: サムネイル画像のパス
+    - 戻り値: JPEGのバイナリデータ
+    """
+    with Image.open(path) as image:
+        # JPEGは縮小デコードで読み込み量を減らす
+        # デコードはメモリ予算を確保してから行う
+        with decode_budget.admit(image, target_size=(PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4)):
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # 透明度がある場合は白背景で合成
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+class PlaceholderStore:
+    """
+    一覧表示用の極小プレースホルダー画像を id+mtime をキーに保存する
+    - 生成はバックグラウンドで1回だけ行い、リクエスト時はDBから一括で読み出すだけにする
+    """
+    def __init__(self, get_thumbnail_path, db_path: str = PLACEHOLDER_DB):
+        """
+        Args:
+            get_thumbnail_path (callable): アイテムIDからサムネイルのパスを返す関数
+            db_path (str): 保存先のSQLiteファイル
+        """
+        self.get_thumbnail_path = get_thumbnail_path
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pending: set[tuple[str, int]] = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="placeholder")
+        self.conn = None
+
+    def connect(self):
+        """DB接続（初回のみ作成）"""
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS placeholder ("
+                "id TEXT PRIMARY KEY, mtime INTEGER NOT NULL, data BLOB NOT NULL)"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def attach(self, items: list):
+        """
+        アイテム一覧に placeholder（data URI）を付与する
+        - 保存されていない・古いものはバックグラウンドで生成をキューに入れる
+        """
+        keys = {item['id']: int(item.get('modificationTime') or 0) for item in items if 'id' in item}
+        if not keys:
+            return
+
+        with self.lock:
+            conn = self.connect()
+            ids = list(keys.keys())
+            rows = {}
+            # SQLiteの変数上限を考慮して分割して取得
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for item_id, mtime, data in conn.execute(
+                    f"SELECT id, mtime, data FROM placeholder WHERE id IN ({placeholders})", chunk
+                ):
+                    rows[item_id] = (mtime, data)
+
+        for item in items:
+            item_id = item.get('id')
+            if item_id not in keys:
+                continue
+            row = rows.get(item_id)
+            if row is not None and row[0] == keys[item_id]:
+                item['placeholder'] = "data:image/jpeg;base64," + base64.b64encode(row[1]).decode('ascii')
+            else:
+                self.schedule(item_id, keys[item_id])
+
+    def schedule(self, item_id: str, mtime: int):
+        """プレースホルダー生成を予約（重複は無視）"""
+        key = (item_id, mtime)
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        self.executor.submit(self.generate, item_id, mtime)
+
+    def generate(self, item_id: str, mtime: int):
+        """プレースホルダーを生成して保存"""
+        try:
+            path = self.get_thumbnail_path(item_id)
+            if path is None:
+                return
+            data = make_placeholder(path)
+            with self.lock:
+                conn = self.connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO placeholder (id, mtime, data) VALUES (?, ?, ?)",
+                    (item_id, mtime, data)
+                )
+                conn.commit()
+            debug_print(f"Generated placeholder for {item_id}: {len(data)} bytes")
+        except Exception as e:
+            debug_print(f"Error generating placeholder for {item_id}: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard((item_id, mtime))
@@ -0,0 +1,223 @@
+import hashlib
+import io
+import math
+import os
+import random
+import threading
+import weakref
+from PIL import Image
+from .util import TILE_CACHE_DIR, cleanup_expired_cache
+from .decode_budget import decode_budget
+from .debug_logger import debug_print
+
+
+# タイルの一辺（px）
+TILE_SIZE = 512
+# タイルのjpeg圧縮率
+TILE_QUALITY = 85
+# レベル生成済みを示すファイル名
+LEVEL_DONE_MARKER = ".done"
+
+# 同じ画像・レベルの生成を重複させないためのロック
+# 使っているリクエストが無くなったら自動で消える
+level_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+level_locks_lock = threading.Lock()
+
+
+def get_tile_info(path: str) -> dict:
+    """
+    画像ヘッダーからタイルピラミッドの情報を取得（デコードはしない）
+    - レベルは DZI と同じく 0 が 1x1px、max_level が原寸
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+
+    return {
+        "width": width,
+        "height": height,
+        "tileSize": TILE_SIZE,
+        "overlap": 0,
+        "format": "jpeg",
+        "maxLevel": get_max_level(width, height),
+    }
+
+
+def get_max_level(width: int, height: int) -> int:
+    """原寸に相当するレベルを取得"""
+    return math.ceil(math.log2(max(width, height, 1)))
+
+
+def get_level_size(width: int, height: int, level: int) -> tuple[int, int]:
+    """指定レベルでの画像サイズを取得（1つ下のレベルは半分の切り上げになる）"""
+    scale = 2 ** (get_max_level(width, height) - level)
+    return max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))
+
+
+def get_tile_count(level_width: int, level_height: int) -> tuple[int, int]:
+    """レベル内のタイル数（横, 縦）"""
+    return math.ceil(level_width / TILE_SIZE), math.ceil(level_height / TILE_SIZE)
+
+
+def get_tile_cache_dir(path: str) -> str:
+    """画像ごとのタイルキャッシュのディレクトリ（元画像の更新時刻が変われば別キー）"""
+    mtime = os.path.getmtime(path)
+    key = hashlib.md5(f"{path}_{mtime}_{TILE_SIZE}_{TILE_QUALITY}".encode()).hexdigest()
+    return os.path.join(TILE_CACHE_DIR, key)
+
+
+def get_tile_cache_path(cache_dir: str, level: int, x: int, y: int) -> str:
+    """タイルキャッシュのパスを取得"""
+    return os.path.join(cache_dir, str(level), f"{x}_{y}.jpg")
+
+
+def get_level_lock(cache_dir: str, level: int) -> threading.Lock:
+    with level_locks_lock:
+        lock = level_locks.get((cache_dir, level))
+        if lock is None:
+            lock = threading.Lock()
+            level_locks[(cache_dir, level)] = lock
+        return lock
+
+
+def is_level_done(cache_dir: str, level: int) -> bool:
+    return os.path.exists(os.path.join(cache_dir, str(level), LEVEL_DONE_MARKER))
+
+
+def load_tile(path: str, level: int, x: int, y: int):
+    """
+    元画像から指定レベルのタイルを取得（ディスクキャッシュ付き）
+    - キャッシュに無ければ、そのレベルと下位レベルのタイルをまとめて生成する
+    - path: 元画像のパス
+    - level: ピラミッドのレベル（max_level で原寸）
+    - x, y: タイル座標
+    - 戻り値: (バイナリデータ, Content-Type)のタプル
+    """
+    # 期限切れキャッシュのクリーンアップ（たまに実行）
+    if random.randint(1, 100) == 1:
+        cleanup_expired_cache()
+
+    cache_dir = get_tile_cache_dir(path)
+    cache_path = get_tile_cache_path(cache_dir, level, x, y)
+    if os.path.exists(cache_path):
+        return read_cached_tile(cache_dir, cache_path), 'image/jpeg'
+
+    with get_level_lock(cache_dir, level):
+        # 待っている間に他のリクエストが生成しているかもしれない
+        if os.path.exists(cache_path):
+            return read_cached_tile(cache_dir, cache_path), 'image/jpeg'
+        return build_levels(path, cache_dir, level, x, y), 'image/jpeg'
+
+
+def read_cached_tile(cache_dir: str, cache_path: str) -> bytes:
+    """キャッシュからタイルを読み込み、ピラミッドの最終利用時刻を更新"""
+    with open(cache_path, 'rb') as f:
+        content = f.read()
+    try:
+        os.utime(cache_dir)
+    except OSError:
+        pass
+    return content
+
+
+def build_levels(path: str, cache_dir: str, level: int, x: int, y: int) -> bytes:
+    """
+    元画像を1回だけデコードして、指定レベルの全タイルを生成する
+    - 下位レベルは半分ずつ縮小して生成済みのレベルまで作る
+    - 戻り値: 要求されたタイルのバイナリデータ
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        max_level = get_max_level(width, height)
+        if level < 0 or level > max_level:
+            raise ValueError(f"Invalid tile level: {level} (max {max_level})")
+
+        level_width, level_height = get_level_size(width, height, level)
+        columns, rows = get_tile_count(level_width, level_height)
+        if x < 0 or y < 0 or x >= columns or y >= rows:
+            raise ValueError(f"Invalid tile position: {level}/{x}_{y}")
+
+        # パレット・16bitなどはそのままでは縮小補間できないので変換する
+        working_mode = image.mode if image.mode in ('RGB', 'RGBA', 'L', 'LA') else 'RGBA'
+
+        # JPEGは縮小デコードで必要な解像度だけ読み込む
+        # デコードはメモリ予算を（変換後のモードで見積もって）確保してから行う
+        with decode_budget.admit(image, target_size=(level_width, level_height), mode=working_mode):
+            if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                level_image = image.convert(working_mode)
+            else:
+                level_image = image
+                level_image.load()
+
+            if level_image.size != (level_width, level_height):
+                level_image = level_image.resize((level_width, level_height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        # エンコードは時間がかかるので、レベル画像ができたら予算を返して他のデコードを通す
+        debug_print(f"Building tiles from level {level} ({level_width}x{level_height})")
+
+    requested = save_level_tiles(level_image, cache_dir, level, (x, y))
+
+    # 下位レベルは半分ずつ縮小して生成（生成済みのレベルに当たったら終了）
+    for lower in range(level - 1, -1, -1):
+        with get_level_lock(cache_dir, lower):
+            if is_level_done(cache_dir, lower):
+                break
+            level_image = level_image.resize(get_level_size(width, height, lower), Image.Resampling.LANCZOS)
+            save_level_tiles(level_image, cache_dir, lower)
+
+    return requested
+
+
+def save_level_tiles(level_image, cache_dir: str, level: int, requested: tuple[int, int] | None = None) -> bytes | None:
+    """
+    レベル画像を全タイルに分割して保存する
+    - 戻り値: requested で指定したタイルのバイナリデータ
+    """
+    level_width, level_height = level_image.size
+    columns, rows = get_tile_count(level_width, level_height)
+    level_dir = os.path.join(cache_dir, str(level))
+    requested_content = None
+
+    try:
+        os.makedirs(level_dir, exist_ok=True)
+    except OSError as e:
+        debug_print(f"Error creating tile cache {level_dir}: {e}")
+
+    for y in range(rows):
+        for x in range(columns):
+            box = (x * TILE_SIZE, y * TILE_SIZE, min((x + 1) * TILE_SIZE, level_width), min((y + 1) * TILE_SIZE, level_height))
+            content = encode_tile(level_image.crop(box))
+            if (x, y) == requested:
+                requested_content = content
+            write_atomic(get_tile_cache_path(cache_dir, level, x, y), content)
+
+    write_atomic(os.path.join(level_dir, LEVEL_DONE_MARKER), b"")
+    debug_print(f"Saved {columns * rows} tiles for level {level}: {level_dir}")
+    return requested_content
+
+
+def encode_tile(tile) -> bytes:
+    """タイルをJPEGに変換"""
+    # RGBAモードの場合はRGBに変換（JPEG保存のため）
+    if tile.mode in ('RGBA', 'LA'):
+        # 透明度がある場合は白背景で合成
+        tile = tile.convert('RGBA')
+        background = Image.new('RGB', tile.size, (255, 255, 255))
+        background.paste(tile, mask=tile.split()[-1])
+        tile = background
+    elif tile.mode != 'RGB':
+        tile = tile.convert('RGB')
+
+    output = io.BytesIO()
+    tile.save(output, format='JPEG', quality=TILE_QUALITY)
+    return output.getvalue()
+
+
+def write_atomic(path: str, content: bytes):
+    """読み込み中のリクエストに書きかけのファイルを見せないように保存"""
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except OSError as e:
+        # クリーンアップでディレクトリごと消された場合など
+        debug_print(f"Error saving tile to cache {path}: {e}")
@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from .debug_logger import debug_print
+
+
+# Eagle API呼び出しのタイムアウト（接続, 読み込み）秒
+REQUEST_TIMEOUT = (3, 10)
+# 連続で失敗したらサーキットを開く回数
+FAILURE_THRESHOLD = 3
+# サーキットを開いてから再試行するまでの時間（秒）
+RESET_SECONDS = 10
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Eagleが不調なため呼び出しを行わずに失敗させる"""
+
+
+class CircuitBreaker:
+    """
+    Eagle API呼び出しのサーキットブレーカー
+    - 連続で失敗したら一定時間は呼び出さずに即座に失敗させる
+    - 時間が経ったら1件だけ試し、成功すれば元に戻す
+    """
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_seconds: float = RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """呼び出し前のチェック。開いている場合は CircuitOpenError"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_running:
+                raise CircuitOpenError("Eagle API is unavailable (circuit open)")
+            # 再試行は1件だけ通す
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                debug_print("Eagle API recovered, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                debug_print(f"Eagle API failing ({self.failures} times), opening circuit")
+                self.opened_at = time.monotonic()
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "open": self.opened_at is not None,
+                "failures": self.failures,
+            }
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Eagle側の不調とみなすエラーかどうか（4xxはリクエストの問題なので除く）"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+class StaleCache:
+    """
+    stale-while-revalidate のキャッシュ
+    - fresh_seconds 以内: キャッシュをそのまま返す
+    - stale_seconds 以内: キャッシュを即座に返し、裏で取り直す
+    - それ以降: 取り直しを待つ。失敗したら古いキャッシュを返す
+    - invalidate() より前に始まった取得の結果は保存しない（更新前の内容で上書きしないように）
+    """
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidate")
+
+    def __init__(self, fresh_seconds: float, stale_seconds: float, max_entries: int = 1000):
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.refreshing: set = set()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """
+        キャッシュから取得
+        - key: キャッシュキー
+        - fetch: 値を取得する関数（失敗時は例外を投げる。None はキャッシュしない）
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is not None:
+            stored_at, value = entry
+            age = time.monotonic() - stored_at
+            if age < self.fresh_seconds:
+                return value
+            if age < self.stale_seconds:
+                self.revalidate(key, fetch)
+                return value
+
+        try:
+            return self.fetch_and_store(key, fetch)
+        except Exception as e:
+            if entry is None:
+                raise
+            debug_print(f"Upstream fetch failed, serving stale data for {key}: {e}")
+            return entry[1]
+
+    def fetch_and_store(self, key, fetch):
+        with self.lock:
+            generation = self.generation
+        value = fetch()
+        if value is not None:
+            with self.lock:
+                if generation != self.generation:
+                    # 取得中に invalidate() されたので、この結果は古いかもしれない
+                    return value
+                self.entries[key] = (time.monotonic(), value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return value
+
+    def revalidate(self, key, fetch):
+        """裏で取り直す（同じキーの取り直しは重複させない）"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def task():
+            try:
+                self.fetch_and_store(key, fetch)
+            except Exception as e:
+                debug_print(f"Background revalidation failed for {key}: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        self.executor.submit(task)
+
+    def invalidate(self):
+        """
+        全エントリを期限切れにする
+        - 次回は取り直しを待つが、失敗したときのために値は残しておく
+        """
+        with self.lock:
+            self.generation += 1
+            for key, (_, value) in self.entries.items():
+                self.entries[key] = (float('-inf'), value)
@@ -1,11 +1,13 @@
 import base64
 import os
 import hashlib
+import shutil
 import time
 from datetime import datetime, timedelta
 from PIL import Image, ImageFile
 import io
 from .debug_logger import debug_print
+from .decode_budget import decode_budget, DecodeBusyError
 
 # PILの画像サイズ制限を緩和（decompression bomb対策を無効化）
 Image.MAX_IMAGE_PIXELS = None
@@ -14,6 +16,8 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 # キャッシュディレクトリ
 CACHE_DIR = "cache"
 CACHE_EXPIRY_HOURS = 1
+# タイルキャッシュの保存先（画像ごとのディレクトリ）
+TILE_CACHE_DIR = os.path.join(CACHE_DIR, "tiles")
 
 def get_cache_key(path: str, max_file_size: int, quality: int) -> str:
     """キャッシュキーを生成"""
@@ -102,6 +106,36 @@ def cleanup_expired_cache():
     except Exception as e:
         debug_print(f"Error during cache cleanup: {e}")
 
+    cleanup_expired_tiles()
+
+def cleanup_expired_tiles():
+    """
+    期限切れのタイルキャッシュを画像ごとに削除
+    - 最終利用時刻はタイル読み込み時に画像ごとのディレクトリに記録している
+    """
+    if not os.path.exists(TILE_CACHE_DIR):
+        return
+
+    try:
+        expiry_time = datetime.now() - timedelta(hours=CACHE_EXPIRY_HOURS)
+        deleted_count = 0
+
+        for dirname in os.listdir(TILE_CACHE_DIR):
+            tile_dir = os.path.join(TILE_CACHE_DIR, dirname)
+            try:
+                cache_time = datetime.fromtimestamp(os.path.getmtime(tile_dir))
+                if cache_time <= expiry_time:
+                    shutil.rmtree(tile_dir)
+                    deleted_count += 1
+            except OSError:
+                # ディレクトリが削除できない場合はスキップ
+                pass
+
+        if deleted_count > 0:
+            debug_print(f"Cleaned up {deleted_count} expired tile pyramids")
+    except Exception as e:
+        debug_print(f"Error during tile cache cleanup: {e}")
+
 # def detect_image_type(data: bytes) -> str:
 #     """
 #     画像データの内容からMIMEタイプを判断
@@ -144,6 +178,7 @@ def load_image(path: str, max_file_size=0, quality=85):
         should_compress = max_file_size > 0 and file_size_kb > max_file_size
         cache_key = None
         cache_path = None
+        degraded = False
         
         if should_compress:
             # キャッシュキーを生成
@@ -165,19 +200,24 @@ def load_image(path: str, max_file_size=0, quality=85):
             debug_print(f"Compressing image from {file_size_kb:.2f}KB to target {max_file_size}KB")
             
             try:
-                # PILで画像を開く
-                with Image.open(path) as image:
-                    debug_print(f"Original image size: {image.size} ({image.size[0] * image.size[1]} pixels)")
-                    
-                    # 画像サイズが非常に大きい場合はリサイズ
-                    # ファイルサイズに応じて最大解像度を調整
-                    if file_size_kb > 10000:  # 10MB以上
-                        max_dimension = 2048  # 2K解像度
-                    elif file_size_kb > 5000:  # 5MB以上
-                        max_dimension = 3072  # 3K解像度
-                    else:
-                        max_dimension = 4096  # 4K解像度
-                    
+                # 画像サイズが非常に大きい場合はリサイズ
+                # ファイルサイズに応じて最大解像度を調整
+                if file_size_kb > 10000:  # 10MB以上
+                    max_dimension = 2048  # 2K解像度
+                elif file_size_kb > 5000:  # 5MB以上
+                    max_dimension = 3072  # 3K解像度
+                else:
+                    max_dimension = 4096  # 4K解像度
+
+                # PILで画像を開く（ヘッダーのみ）
+                # デコードはメモリ予算を確保してから行い、混雑時は半分の解像度に落とす
+                with Image.open(path) as image, decode_budget.admit(
+                    image,
+                    target_size=(max_dimension, max_dimension),
+                    degraded_size=(max_dimension // 2, max_dimension // 2),
+                ) as degraded:
+                    debug_print(f"Decoding image size: {image.size} ({image.size[0] * image.size[1]} pixels)")
+
                     if max(image.size) > max_dimension:
                         ratio = max_dimension / max(image.size)
                         new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
@@ -204,6 +244,9 @@ def load_image(path: str, max_file_size=0, quality=85):
                     compressed_size_kb = len(content) / 1024
                     debug_print(f"Compressed to {compressed_size_kb:.2f}KB")
                     
+            except DecodeBusyError:
+                # 混雑時に原寸のまま返すと重くなるだけなので断る
+                raise
             except Exception as compression_error:
                 debug_print(f"Compression failed: {compression_error}, falling back to original")
                 # 圧縮に失敗した場合は元ファイルを返す
@@ -216,8 +259,8 @@ def load_image(path: str, max_file_size=0, quality=85):
                 content = image_file.read()
             content_type = get_content_type_from_path(path)
         
-        # 圧縮が実行された場合のみキャッシュに保存
-        if should_compress and cache_path is not None:
+        # 圧縮が実行された場合のみキャッシュに保存（混雑で解像度を落としたものは除く）
+        if should_compress and cache_path is not None and not degraded:
             save_to_cache(cache_path, content, content_type)
         
         return content, content_type
@@ -9,6 +9,7 @@ class EagleApi {
   public isFoldersLoading = ref(false);
   private error = ref<string | null>(null);
   private store = useMainStore();
+  private eventSource: EventSource | null = null;
 
   private constructor() {}
 
@@ -55,6 +56,7 @@ class EagleApi {
       const url = new URL(`${API_BASE_URL}/list`, window.location.origin)
       url.searchParams.append('limit', limit.toString())
       url.searchParams.append('offset', offset.toString())
+      url.searchParams.append('placeholder', 'true')
       if (folderId && folderId !== 'all') {
         url.searchParams.append('folders', folderId)
       }
@@ -129,6 +131,8 @@ class EagleApi {
     // 初回読み込みの場合は画像をクリア
     if (offset === 0) {
       this.store.setImages([])
+      this.store.setImagesStale(false)
+      this.store.resetCurrentPageCount()
       console.log("初回呼び出し");
     } else {
       console.log("2回目以降の呼び出し");
@@ -266,6 +270,45 @@ class EagleApi {
     }
   }
 
+  /**
+   * サーバーからの変更イベントを購読して一覧をその場で更新する
+   * - 一覧の再取得をせずに他の端末やEagle本体での変更を反映する
+   */
+  public subscribeChanges(): void {
+    if (this.eventSource) return;
+
+    // EventSource は切断時に自動で再接続する
+    this.eventSource = new EventSource(`${API_BASE_URL}/events`);
+
+    this.eventSource.addEventListener('item.updated', (e: MessageEvent) => {
+      const { id, ...data } = JSON.parse(e.data);
+      this.store.patchImage(id, data);
+    });
+
+    this.eventSource.addEventListener('item.added', (e: MessageEvent) => {
+      const { item } = JSON.parse(e.data) as { item: TImageItem };
+      const folderId = this.store.getCurrentFolderId;
+      if (this.store.getImages.some(img => img.id === item.id)) return;
+      // 表示中のフォルダに属さないものは無視
+      if (folderId !== 'all' && !(folderId && item.folders?.includes(folderId))) return;
+
+      // 一覧の並び順での挿入位置が分からないので再読み込みを促す
+      this.store.setImagesStale(true);
+    });
+
+    this.eventSource.addEventListener('item.deleted', (e: MessageEvent) => {
+      const { ids } = JSON.parse(e.data) as { ids: string[] };
+      this.store.removeImages(ids);
+    });
+
+    this.eventSource.addEventListener('folder.changed', async () => {
+      // フォルダ一覧は小さいので丸ごと取り直す
+      if (this.isFoldersLoading.value) return;
+      this.store.setFolders([]);
+      await this.loadFolders();
+    });
+  }
+
   /**
    * 画像情報を更新する
    * @param itemId 画像のID
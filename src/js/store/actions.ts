@@ -12,6 +12,22 @@ export const actions = {
     this.images.push(...images);
   },
   
+  // 画像のプロパティを部分更新（変更イベント用）
+  patchImage(this: TStoreState, imageId: string, data: Partial<TImageItem>) {
+    const image = this.images.find((img: TImageItem) => img.id === imageId);
+    if (image) {
+      Object.assign(image, data);
+    }
+    if (this.currentImage && this.currentImage.id === imageId) {
+      Object.assign(this.currentImage, data);
+    }
+  },
+
+  // 画像一覧から削除（変更イベント用）
+  removeImages(this: TStoreState, imageIds: string[]) {
+    this.images = this.images.filter((img: TImageItem) => !imageIds.includes(img.id));
+  },
+
   // フォルダ一覧を設定
   setFolders(this: TStoreState, folders: TFolderItem[]) {
     this.folders = folders;
@@ -23,11 +39,21 @@ export const actions = {
     this.currentImage = image || null;
   },
 
+  // 一覧が古くなったかを設定
+  setImagesStale(this: TStoreState, isStale: boolean) {
+    this.isImagesStale = isStale;
+  },
+
   // ページカウントを追加
   addCurrentPageCount(this: TStoreState) {
     this.currentPageCount += 1;
   },
 
+  // ページカウントをリセット（先頭から読み直す場合）
+  resetCurrentPageCount(this: TStoreState) {
+    this.currentPageCount = 0;
+  },
+
   // 現在のフィルタクエリを設定
   setCurrentFilter(this: TStoreState, filter: TFilter | null) {
     this.currentFilter = filter;
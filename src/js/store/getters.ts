@@ -20,6 +20,9 @@ export const getters = {
   // 現在の取得済みページ数
   getCurrentPageCount: (state: TStoreState) => state.currentPageCount,
 
+  // 一覧が古くなったかを取得
+  getImagesStale: (state: TStoreState) => state.isImagesStale,
+
   // 現在のフォルダIdを取得
   getCurrentFolderId: (state: TStoreState) => state.currentFolderId,
 
@@ -12,6 +12,7 @@ export type TStoreState = {
   currentFolderId: string | null
   currentFilter: TFilter | null // 現在の検索クエリ
   currentPageCount: number // 取得したページ数
+  isImagesStale: boolean // 表示中の一覧より新しい画像がある
   expandedFolders: string[]
   extList: string[]  // 拡張子リスト
   isSelectMode: boolean // 複数選択モード
@@ -28,6 +29,7 @@ export const useMainStore = defineStore('main', {
     currentFolderId: null,
     currentFilter: null,
     currentPageCount: 0,
+    isImagesStale: false,
     expandedFolders: [],
     extList: [],
     isSelectMode: false,
@@ -27,6 +27,7 @@ export type TImageItem = {
   lastModified: number
   star?: number
   select?: boolean
+  placeholder?: string // 読み込み中に表示する極小画像（data URI）
 }
 
 // export type TQueryParam = {
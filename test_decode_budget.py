@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+画像デコードのメモリ予算（modules/decode_budget.py）のテスト
+"""
+
+import threading
+import time
+import pytest
+from PIL import Image
+from modules import decode_budget as budget_module
+from modules.decode_budget import DecodeBudget, DecodeBusyError, get_draft_size, estimate_decode_cost
+
+
+class FakeImage:
+    """Image.open() 直後の画像の代わり（ヘッダー情報のみ）"""
+    def __init__(self, width, height, format='JPEG', mode='RGB'):
+        self.size = (width, height)
+        self.format = format
+        self.mode = mode
+        self.drafted = None
+
+    def draft(self, mode, size):
+        self.drafted = size
+
+
+def test_draft_size_matches_pillow(tmp_path):
+    """draft() 後のサイズの計算がPillowと一致する"""
+    path = str(tmp_path / "image.jpg")
+    Image.new('RGB', (3001, 2001), (128, 64, 32)).save(path, format='JPEG')
+
+    for size in [(4096, 4096), (1500, 1000), (1000, 1000), (700, 700), (100, 100)]:
+        with Image.open(path) as image:
+            expected = get_draft_size(image, size)
+            image.draft('RGB', size)
+            assert image.size == expected, size
+
+
+def test_draft_size_non_jpeg():
+    """JPEG以外は縮小デコードできないので原寸"""
+    assert get_draft_size(FakeImage(4000, 3000, format='PNG'), (100, 100)) == (4000, 3000)
+    assert get_draft_size(FakeImage(4000, 3000), None) == (4000, 3000)
+
+
+def test_estimate_cost_rgb_is_four_bytes():
+    """RGBは4byte/pxで見積もる"""
+    cost = estimate_decode_cost(FakeImage(100, 100, format='PNG'))
+    assert cost == 100 * 100 * 4 * budget_module.WORKING_COPY_FACTOR
+
+
+def test_estimate_cost_uses_working_mode():
+    """変換後のモードの方が大きければそちらで見積もる"""
+    image = FakeImage(100, 100, format='PNG', mode='P')
+    assert estimate_decode_cost(image) == 100 * 100 * 1 * budget_module.WORKING_COPY_FACTOR
+    assert estimate_decode_cost(image, mode='RGBA') == 100 * 100 * 4 * budget_module.WORKING_COPY_FACTOR
+
+
+def test_try_acquire_within_budget():
+    """予算内なら確保でき、超える分は待たされる"""
+    budget = DecodeBudget(100)
+    assert budget.try_acquire(60, timeout=0)
+    assert not budget.try_acquire(60, timeout=0.05)
+    assert budget.try_acquire(40, timeout=0)
+    assert budget.get_status() == {"budget": 100, "inUse": 100, "active": 2, "waiting": 0}
+    budget.release(60)
+    budget.release(40)
+    assert budget.get_status()["inUse"] == 0
+
+
+def test_oversize_runs_alone():
+    """予算を超えるジョブは他のジョブが無いときだけ単独で実行される"""
+    budget = DecodeBudget(100)
+    assert budget.try_acquire(500, timeout=0)
+    assert not budget.try_acquire(1, timeout=0.05)
+    budget.release(500)
+
+    assert budget.try_acquire(10, timeout=0)
+    assert not budget.try_acquire(500, timeout=0.05)
+    budget.release(10)
+    assert budget.try_acquire(500, timeout=0)
+    budget.release(500)
+
+
+def test_waiting_count():
+    """予算待ちの数が取得できる"""
+    budget = DecodeBudget(100)
+    budget.try_acquire(100)
+    thread = threading.Thread(target=lambda: (budget.try_acquire(50), budget.release(50)))
+    thread.start()
+    time.sleep(0.05)
+    assert budget.get_status()["waiting"] == 1
+    budget.release(100)
+    thread.join()
+    assert budget.get_status() == {"budget": 100, "inUse": 0, "active": 0, "waiting": 0}
+
+
+def test_oversize_not_starved_by_small_jobs():
+    """大きいジョブが待っている間は後から来た小さいジョブに追い越されない"""
+    budget = DecodeBudget(100)
+    budget.try_acquire(10)
+    order = []
+
+    def job(name, cost):
+        budget.try_acquire(cost)
+        order.append(name)
+        budget.release(cost)
+
+    large = threading.Thread(target=job, args=("large", 500))
+    large.start()
+    time.sleep(0.05)
+    # 予算には空きがあるが、先に待っている大きいジョブの後になる
+    assert not budget.try_acquire(10, timeout=0.05)
+    small = threading.Thread(target=job, args=("small", 10))
+    small.start()
+    time.sleep(0.05)
+    assert order == []
+
+    budget.release(10)
+    large.join()
+    small.join()
+    assert order == ["large", "small"]
+
+
+def test_queue_depth_is_capped():
+    """待ちが上限に達していたら待たずに断る"""
+    budget = DecodeBudget(100, max_waiting=1)
+    budget.try_acquire(100)
+    thread = threading.Thread(target=lambda: budget.try_acquire(50, timeout=1))
+    thread.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    assert not budget.try_acquire(50, timeout=1)
+    assert time.monotonic() - started < 0.5
+    budget.release(100)
+    thread.join()
+
+
+def test_admit_gives_up_after_max_wait(monkeypatch):
+    """予算が空かないまま待ち時間の上限を超えたら DecodeBusyError"""
+    monkeypatch.setattr(budget_module, "MAX_WAIT_SECONDS", 0.05)
+    budget = DecodeBudget(1)
+    budget.try_acquire(1)
+
+    image = FakeImage(8000, 6000, format='PNG')
+    with pytest.raises(DecodeBusyError):
+        with budget.admit(image, target_size=(4000, 3000)):
+            pass
+    assert budget.get_status() == {"budget": 1, "inUse": 1, "active": 1, "waiting": 0}
+    budget.release(1)
+
+
+def test_admit_degrades_jpeg_when_busy(monkeypatch):
+    """混雑時、JPEGは解像度を落としてデコードする"""
+    monkeypatch.setattr(budget_module, "DEGRADE_WAIT_SECONDS", 0.05)
+    budget = DecodeBudget(1)
+    budget.try_acquire(1)
+    # 解像度を落としても予算を超えるので、先行ジョブの終了後に単独で実行される
+    threading.Timer(0.1, budget.release, args=(1,)).start()
+
+    image = FakeImage(8000, 6000)
+    with budget.admit(image, target_size=(4000, 3000), degraded_size=(2000, 1500)) as degraded:
+        assert degraded
+        assert image.drafted == (2000, 1500)
+        assert budget.get_status()["active"] == 1
+    assert budget.get_status()["active"] == 0
+
+
+def test_admit_not_degraded_when_free():
+    """空いていれば要求どおりの解像度でデコードする"""
+    budget = DecodeBudget()
+    image = FakeImage(8000, 6000)
+    with budget.admit(image, target_size=(4000, 3000), degraded_size=(2000, 1500)) as degraded:
+        assert not degraded
+        assert image.drafted == (4000, 3000)
+    assert budget.get_status()["inUse"] == 0
+
+
+def test_admit_waits_instead_of_degrading_png(monkeypatch):
+    """縮小デコードできない画像は解像度を落とさずに待つ"""
+    monkeypatch.setattr(budget_module, "DEGRADE_WAIT_SECONDS", 0.01)
+    budget = DecodeBudget(1)
+    budget.try_acquire(1)
+    threading.Timer(0.1, budget.release, args=(1,)).start()
+
+    image = FakeImage(8000, 6000, format='PNG')
+    with budget.admit(image, target_size=(4000, 3000), degraded_size=(2000, 1500)) as degraded:
+        assert not degraded
+        assert image.drafted == (4000, 3000)
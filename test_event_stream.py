@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+変更イベント配信（modules/event_stream.py）のテスト
+"""
+
+import asyncio
+from modules import event_stream
+from modules.event_stream import EventBroker, diff_item_window, format_sse
+
+
+def make_item(item_id, star=0):
+    return {"id": item_id, "name": item_id, "star": star}
+
+
+def test_format_sse():
+    """SSEのメッセージ形式"""
+    assert format_sse("item.deleted", {"ids": ["a"]}) == 'event: item.deleted\ndata: {"ids":["a"]}\n\n'
+
+
+def test_publish_to_all_subscribers():
+    """全購読者に配信される"""
+    async def run():
+        broker = EventBroker()
+        queue1 = broker.subscribe()
+        queue2 = broker.subscribe()
+        broker.publish("item.updated", {"id": "a", "star": 3})
+        assert queue1.get_nowait() == queue2.get_nowait()
+
+    asyncio.run(run())
+
+
+def test_full_queue_drops_subscriber():
+    """受信が追いつかない購読者は切断される"""
+    async def run():
+        broker = EventBroker()
+        slow = broker.subscribe()
+        for i in range(event_stream.SUBSCRIBER_QUEUE_SIZE + 1):
+            broker.publish("item.updated", {"id": str(i)})
+
+        assert slow not in broker.subscribers
+        # 溜まっていたイベントは捨てられ、終了の合図だけが残る
+        assert slow.qsize() == 1
+        assert slow.get_nowait() is None
+
+    asyncio.run(run())
+
+
+def test_stream_ends_when_dropped():
+    """切断されたらストリームが終了する"""
+    async def run():
+        broker = EventBroker()
+        stream = broker.stream()
+        assert (await stream.__anext__()).startswith("retry:")
+
+        queue = next(iter(broker.subscribers))
+        broker.publish("item.deleted", {"ids": ["a"]})
+        assert (await stream.__anext__()).startswith("event: item.deleted")
+
+        queue.put_nowait(None)
+        try:
+            await stream.__anext__()
+            assert False, "stream should stop"
+        except StopAsyncIteration:
+            pass
+        assert not broker.subscribers
+
+    asyncio.run(run())
+
+
+def test_diff_added_only_at_head():
+    """新規アイテムは先頭に現れたものだけ追加とみなす"""
+    prev = [make_item("b"), make_item("c"), make_item("d")]
+    current = [make_item("a"), make_item("b"), make_item("c")]
+    added, updated, deleted = diff_item_window(prev, current)
+    assert [item["id"] for item in added] == ["a"]
+    assert updated == []
+    # d は範囲外に押し出されただけかもしれないので削除とはしない
+    assert deleted == []
+
+
+def test_diff_slide_in_is_not_added():
+    """削除で範囲内に入ってきたアイテムは追加とみなさない"""
+    prev = [make_item("a"), make_item("b"), make_item("c")]
+    current = [make_item("a"), make_item("c"), make_item("d")]
+    added, updated, deleted = diff_item_window(prev, current)
+    assert added == []
+    assert deleted == ["b"]
+
+
+def test_diff_updated():
+    """プロパティの変更を検出する"""
+    prev = [make_item("a", star=0), make_item("b")]
+    current = [make_item("a", star=5), make_item("b")]
+    added, updated, deleted = diff_item_window(prev, current)
+    assert updated == [{"id": "a", "star": 5}]
+
+
+def test_diff_without_common_items():
+    """前回と共通のアイテムが無い場合は何も確定できない"""
+    prev = [make_item("a"), make_item("b")]
+    current = [make_item("x"), make_item("y")]
+    assert diff_item_window(prev, current) == ([], [], [])
+
+
+def test_watcher_invalidates_cache_before_publish():
+    """変更を検出したら配信前にキャッシュを期限切れにする（取り直しで古い一覧を返さないように）"""
+    from modules.upstream import StaleCache
+
+    class FakeApi:
+        def __init__(self):
+            self.list_cache = StaleCache(fresh_seconds=60, stale_seconds=120)
+            self.folder_cache = StaleCache(fresh_seconds=60, stale_seconds=120)
+            self.items = [make_item("a")]
+            self.folders = [{"id": "f", "name": "1"}]
+
+        def fetch_list(self, **kwargs):
+            return {"data": [dict(item) for item in self.items]}
+
+        def fetch_folder_list(self):
+            return {"data": [dict(folder) for folder in self.folders]}
+
+    async def run():
+        api = FakeApi()
+        broker = EventBroker()
+        queue = broker.subscribe()
+        watcher = event_stream.EagleWatcher(api, broker)
+        await watcher.check_items()
+        await watcher.check_folders()
+        api.list_cache.get("list", api.fetch_list)
+        api.folder_cache.get("folders", api.fetch_folder_list)
+
+        api.items = [make_item("b"), make_item("a", star=3)]
+        api.folders = [{"id": "f", "name": "2"}]
+        await watcher.check_items()
+        await watcher.check_folders()
+
+        assert queue.qsize() == 3
+        assert api.list_cache.get("list", api.fetch_list)["data"][0]["id"] == "b"
+        assert api.folder_cache.get("folders", api.fetch_folder_list)["data"][0]["name"] == "2"
+
+    asyncio.run(run())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+一覧表示用プレースホルダー（modules/placeholder.py）のテスト
+"""
+
+import io
+from PIL import Image
+from modules.placeholder import PlaceholderStore, make_placeholder, PLACEHOLDER_SIZE
+
+
+def save_test_image(path, size=(300, 200), mode='RGB', format='PNG'):
+    image = Image.effect_mandelbrot(size, (-2, -1.2, 1, 1.2), 50).convert(mode)
+    image.save(path, format=format)
+    return path
+
+
+def test_make_placeholder_is_tiny(tmp_path):
+    """極小サイズのJPEGが生成される"""
+    path = save_test_image(str(tmp_path / "thumb.png"))
+    data = make_placeholder(path)
+
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'JPEG'
+        assert max(image.size) == PLACEHOLDER_SIZE
+    assert len(data) < 400
+
+
+def test_make_placeholder_transparent(tmp_path):
+    """透明度のある画像も生成できる"""
+    path = save_test_image(str(tmp_path / "thumb.png"), mode='RGBA')
+    with Image.open(io.BytesIO(make_placeholder(path))) as image:
+        assert image.mode == 'RGB'
+
+
+def test_attach_generates_then_serves(tmp_path):
+    """初回は生成を予約し、生成後は一覧に付与される"""
+    path = save_test_image(str(tmp_path / "thumb.png"))
+    store = PlaceholderStore(lambda item_id: path, db_path=str(tmp_path / "placeholder.db"))
+
+    items = [{"id": "a", "modificationTime": 1}]
+    store.attach(items)
+    assert "placeholder" not in items[0]
+    store.executor.shutdown(wait=True)
+
+    items = [{"id": "a", "modificationTime": 1}]
+    store.attach(items)
+    assert items[0]["placeholder"].startswith("data:image/jpeg;base64,")
+
+
+def test_attach_ignores_stale_mtime(tmp_path):
+    """更新時刻が変わったものは付与せずに作り直す"""
+    path = save_test_image(str(tmp_path / "thumb.png"))
+    store = PlaceholderStore(lambda item_id: path, db_path=str(tmp_path / "placeholder.db"))
+    store.generate("a", 1)
+
+    items = [{"id": "a", "modificationTime": 2}]
+    store.attach(items)
+    assert "placeholder" not in items[0]
+    store.executor.shutdown(wait=True)
+
+    items = [{"id": "a", "modificationTime": 2}]
+    store.attach(items)
+    assert "placeholder" in items[0]
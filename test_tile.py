@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+ディープズーム用タイル（modules/tile.py）のテスト
+"""
+
+import io
+import os
+import time
+import pytest
+from PIL import Image
+from modules import tile, util
+from modules.tile import get_max_level, get_level_size, get_tile_count, load_tile, TILE_SIZE
+
+
+@pytest.fixture
+def tile_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "tiles")
+    monkeypatch.setattr(tile, "TILE_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(util, "TILE_CACHE_DIR", cache_dir)
+    return cache_dir
+
+
+def save_test_image(path, size=(1300, 700)):
+    image = Image.effect_mandelbrot(size, (-2, -1.2, 1, 1.2), 50).convert('RGB')
+    image.save(path, format='PNG')
+    return path
+
+
+def test_level_math():
+    """レベルごとのサイズとタイル数"""
+    assert get_max_level(1, 1) == 0
+    assert get_max_level(1300, 700) == 11
+    assert get_level_size(1300, 700, 11) == (1300, 700)
+    assert get_level_size(1300, 700, 10) == (650, 350)
+    assert get_level_size(1300, 700, 9) == (325, 175)
+    assert get_level_size(1300, 700, 0) == (1, 1)
+    assert get_tile_count(1300, 700) == (3, 2)
+    assert get_tile_count(TILE_SIZE, TILE_SIZE) == (1, 1)
+
+
+def test_invalid_tile(tmp_path, tile_cache):
+    """範囲外のレベル・位置はエラー"""
+    path = save_test_image(str(tmp_path / "original.png"))
+    with pytest.raises(ValueError):
+        load_tile(path, 12, 0, 0)
+    with pytest.raises(ValueError):
+        load_tile(path, 11, 3, 0)
+    with pytest.raises(ValueError):
+        load_tile(path, 11, 0, -1)
+
+
+def test_level_built_from_one_decode(tmp_path, tile_cache, monkeypatch):
+    """1回のデコードで指定レベルと下位レベルの全タイルが生成される"""
+    path = save_test_image(str(tmp_path / "original.png"))
+    content, content_type = load_tile(path, 11, 2, 1)
+    assert content_type == 'image/jpeg'
+    with Image.open(io.BytesIO(content)) as image:
+        assert image.size == (1300 - 2 * TILE_SIZE, 700 - TILE_SIZE)
+
+    cache_dir = tile.get_tile_cache_dir(path)
+    for level in range(0, 12):
+        columns, rows = get_tile_count(*get_level_size(1300, 700, level))
+        for y in range(rows):
+            for x in range(columns):
+                assert os.path.exists(tile.get_tile_cache_path(cache_dir, level, x, y))
+
+    # 以降はキャッシュから返されデコードしない
+    def fail(*args, **kwargs):
+        raise AssertionError("should not decode")
+    monkeypatch.setattr(tile, "build_levels", fail)
+    load_tile(path, 11, 0, 0)
+    load_tile(path, 9, 0, 0)
+
+
+def test_lower_request_does_not_build_upper(tmp_path, tile_cache):
+    """下位レベルの要求では上位レベルは生成しない"""
+    path = save_test_image(str(tmp_path / "original.png"))
+    load_tile(path, 10, 0, 0)
+
+    cache_dir = tile.get_tile_cache_dir(path)
+    assert tile.is_level_done(cache_dir, 10)
+    assert tile.is_level_done(cache_dir, 0)
+    assert not tile.is_level_done(cache_dir, 11)
+
+
+def test_budget_released_before_encoding(tmp_path, tile_cache, monkeypatch):
+    """タイルのエンコード中はデコード予算を確保したままにしない"""
+    path = save_test_image(str(tmp_path / "original.png"))
+    save_level_tiles = tile.save_level_tiles
+    in_use = []
+
+    def record(*args, **kwargs):
+        in_use.append(tile.decode_budget.get_status()["inUse"])
+        return save_level_tiles(*args, **kwargs)
+    monkeypatch.setattr(tile, "save_level_tiles", record)
+
+    load_tile(path, 11, 0, 0)
+    assert in_use and set(in_use) == {0}
+
+
+def test_level_locks_are_released(tmp_path, tile_cache):
+    """生成が終わったレベルのロックは残らない"""
+    path = save_test_image(str(tmp_path / "original.png"))
+    load_tile(path, 11, 0, 0)
+    assert len(tile.level_locks) == 0
+
+
+def test_cleanup_expired_tiles(tmp_path, tile_cache):
+    """期限切れのピラミッドはディレクトリごと削除される"""
+    path = save_test_image(str(tmp_path / "original.png"))
+    load_tile(path, 8, 0, 0)
+    cache_dir = tile.get_tile_cache_dir(path)
+
+    util.cleanup_expired_tiles()
+    assert os.path.exists(cache_dir)
+
+    expired = time.time() - (util.CACHE_EXPIRY_HOURS * 3600 + 60)
+    os.utime(cache_dir, (expired, expired))
+    util.cleanup_expired_tiles()
+    assert not os.path.exists(cache_dir)
+
+
+def test_tile_endpoints_return_404(monkeypatch):
+    """画像が見つからない場合は404"""
+    from fastapi import HTTPException
+    import index
+
+    monkeypatch.setattr(index.eagle_api, "get_tile_info", lambda *args: None)
+    monkeypatch.setattr(index.eagle_api, "get_tile", lambda *args: None)
+    for call in (lambda: index.get_tile_info("a"), lambda: index.get_tile("a", 0, 0, 0)):
+        with pytest.raises(HTTPException) as e:
+            call()
+        assert e.value.status_code == 404
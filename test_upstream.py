@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Eagle API呼び出しの耐障害化（modules/upstream.py）のテスト
+"""
+
+import threading
+import time
+import pytest
+import requests
+from modules import upstream
+from modules.upstream import CircuitBreaker, CircuitOpenError, StaleCache, is_upstream_failure
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def test_is_upstream_failure():
+    """5xx・タイムアウト・接続エラーはEagleの不調、4xxは除く"""
+    assert is_upstream_failure(http_error(503))
+    assert not is_upstream_failure(http_error(404))
+    assert is_upstream_failure(requests.exceptions.Timeout())
+    assert is_upstream_failure(requests.exceptions.ConnectionError())
+    assert not is_upstream_failure(OSError())
+
+
+def test_breaker_opens_after_threshold():
+    """連続で失敗したら開き、呼び出さずに失敗させる"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.get_status() == {"open": True, "failures": 2}
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_failures():
+    """途中で成功すれば失敗回数は数え直し"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.get_status() == {"open": False, "failures": 1}
+    breaker.before_call()
+
+
+def test_breaker_half_open_allows_one_trial():
+    """時間が経ったら1件だけ試し、成功すれば閉じる"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.get_status() == {"open": False, "failures": 0}
+    breaker.before_call()
+
+
+def test_breaker_failed_trial_reopens():
+    """試した1件が失敗したら再び一定時間開く"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def wait_for_refresh(cache):
+    for _ in range(100):
+        with cache.lock:
+            if not cache.refreshing:
+                return
+        time.sleep(0.01)
+    raise AssertionError("revalidation did not finish")
+
+
+def test_cache_fresh_returns_cached():
+    """fresh_seconds 以内は取得しない"""
+    cache = StaleCache(fresh_seconds=60, stale_seconds=120)
+    calls = []
+    fetch = lambda: calls.append(1) or len(calls)
+    assert cache.get("a", fetch) == 1
+    assert cache.get("a", fetch) == 1
+    assert len(calls) == 1
+
+
+def test_cache_stale_revalidates_in_background():
+    """stale_seconds 以内は古い値をすぐ返し、裏で取り直す"""
+    cache = StaleCache(fresh_seconds=0, stale_seconds=60)
+    values = iter(["old", "new"])
+    fetch = lambda: next(values)
+    assert cache.get("a", fetch) == "old"
+    assert cache.get("a", fetch) == "old"
+    wait_for_refresh(cache)
+    assert cache.entries["a"][1] == "new"
+
+
+def test_cache_failure_serves_stale():
+    """期限切れで取得に失敗したら古い値を返す。キャッシュが無ければ例外"""
+    cache = StaleCache(fresh_seconds=0, stale_seconds=0)
+    cache.get("a", lambda: "old")
+
+    def fail():
+        raise requests.exceptions.Timeout()
+    assert cache.get("a", fail) == "old"
+    with pytest.raises(requests.exceptions.Timeout):
+        cache.get("b", fail)
+
+
+def test_cache_none_not_stored():
+    """None はキャッシュしない"""
+    cache = StaleCache(fresh_seconds=60, stale_seconds=120)
+    assert cache.get("a", lambda: None) is None
+    assert "a" not in cache.entries
+
+
+def test_cache_lru_eviction():
+    """max_entries を超えたら最近使っていないものから消す"""
+    cache = StaleCache(fresh_seconds=60, stale_seconds=120, max_entries=2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.get("a", lambda: 1)
+    cache.get("c", lambda: 3)
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_cache_invalidate_refetches():
+    """invalidate() 後は取り直しを待つ"""
+    cache = StaleCache(fresh_seconds=60, stale_seconds=120)
+    cache.get("a", lambda: "old")
+    cache.invalidate()
+    assert cache.get("a", lambda: "new") == "new"
+
+
+def test_cache_fetch_started_before_invalidate_not_stored():
+    """invalidate() 前に始まった取得の結果で上書きしない"""
+    cache = StaleCache(fresh_seconds=0, stale_seconds=60)
+    cache.get("a", lambda: "old")
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def slow_fetch():
+        started.set()
+        proceed.wait(1)
+        return "before update"
+
+    cache.get("a", slow_fetch)
+    assert started.wait(1)
+    cache.invalidate()
+    proceed.set()
+    wait_for_refresh(cache)
+
+    assert cache.entries["a"][0] == float('-inf')
+    assert cache.get("a", lambda: "after update") == "after update"
+
+
+def test_endpoints_return_503_when_upstream_down(monkeypatch):
+    """Eagleが不調なときは 503 と Retry-After を返す"""
+    from fastapi import HTTPException
+    import index
+
+    def unavailable(*args, **kwargs):
+        raise CircuitOpenError("circuit open")
+    for name in ("get_list", "get_folder_list", "get_thumbnail_image", "get_image", "get_tile_info", "get_tile"):
+        monkeypatch.setattr(index.eagle_api, name, unavailable)
+
+    calls = [
+        lambda: index.get_list(),
+        lambda: index.get_folders(),
+        lambda: index.get_thumbnail_image("a"),
+        lambda: index.get_image("a"),
+        lambda: index.get_tile_info("a"),
+        lambda: index.get_tile("a", 0, 0, 0),
+    ]
+    for call in calls:
+        with pytest.raises(HTTPException) as e:
+            call()
+        assert e.value.status_code == 503
+        assert "Retry-After" in e.value.headers
+
+
+def test_image_endpoints_return_404(monkeypatch):
+    """画像が見つからない場合は 500 ではなく 404"""
+    from fastapi import HTTPException
+    import index
+
+    monkeypatch.setattr(index.eagle_api, "get_thumbnail_image", lambda *args: None)
+    monkeypatch.setattr(index.eagle_api, "get_image", lambda *args: None)
+    for call in (lambda: index.get_thumbnail_image("a"), lambda: index.get_image("a")):
+        with pytest.raises(HTTPException) as e:
+            call()
+        assert e.value.status_code == 404
+
+
+def test_get_list_raises_on_upstream_failure(monkeypatch):
+    """キャッシュが無い状態でEagleが不調なら例外（呼び出し元で 503）"""
+    from modules.eagle_api import EagleApi
+
+    api = EagleApi()
+    def timeout(*args, **kwargs):
+        raise requests.exceptions.Timeout()
+    monkeypatch.setattr(upstream.requests, "request", timeout)
+    with pytest.raises(requests.exceptions.Timeout):
+        api.get_list()